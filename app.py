@@ -1,246 +1,641 @@
 """
 Vend-O-Matic — HTTP vending machine API
-stdlib only: http.server, json, threading, os
+stdlib only, no third-party dependencies
 """
 
+import array
+import asyncio
+import itertools
 import json
 import os
+import queue
+import socket
 import threading
-from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import time
+from email.utils import formatdate
+from http import HTTPStatus
 
 # ---------------------------------------------------------------------------
 # Shared state
-# All reads and writes go through _lock to stay thread-safe when
-# ThreadingHTTPServer dispatches concurrent requests.
+# The event loop runs handlers one at a time, but the state is module-level
+# and may be touched from other threads too (the test suite resets it from
+# its own thread), so every mutation stays guarded; uncontended, the locks cost
+# next to nothing.
+#
+# Locks are striped by what they guard. The coin counter has its own narrow
+# lock, so coin inserts and cancels never wait on inventory traffic. Each item
+# has its own lock, so purchases of different items never block each other.
+# A purchase takes its item lock, then _coins_lock; anything touching several
+# items (a reset) takes the item locks in ID order first. Reads take no lock:
+# a single array element or a tobytes() copy of the whole array is read in
+# one C call, which the GIL keeps consistent against concurrent writers.
 # ---------------------------------------------------------------------------
-_lock = threading.Lock()
-_state = {
-    "coins": 0,           # quarters inserted, not yet spent
-    "inventory": [5, 5, 5],  # quantities for item IDs 0, 1, 2
+ITEM_PRICE = 2     # quarters required per purchase
+ITEM_COUNT = 3     # beverages on offer, IDs 0..ITEM_COUNT-1
+INITIAL_STOCK = 5  # units of each beverage at startup
+
+_item_locks = [threading.Lock() for _ in range(ITEM_COUNT)]
+_coins_lock = threading.Lock()
+
+
+class _State:
+    """
+    Machine state. __slots__ keeps attribute access at fixed offsets, and the
+    inventory is a contiguous array of C ints rather than a list of boxed
+    Python ints.
+    """
+
+    __slots__ = ("coins", "inventory")
+
+    def __init__(self):
+        self.coins = 0  # quarters inserted, not yet spent
+        self.inventory = array.array("i", [INITIAL_STOCK] * ITEM_COUNT)  # by item ID
+
+
+_state = _State()
+
+# ---------------------------------------------------------------------------
+# Preformatted response pieces
+# Responses are assembled from raw bytes; the fixed parts are built once here.
+# ---------------------------------------------------------------------------
+_SERVER_HEADER = b"Server: Vend-O-Matic\r\n"
+# Status line plus Server header: the part of every response head that
+# depends on nothing but the status code
+_RESPONSE_PREFIXES = {
+    code: b"HTTP/1.1 %d %s\r\n" % (code, HTTPStatus(code).phrase.encode())
+    + _SERVER_HEADER
+    for code in (200, 204, 400, 403, 404, 413, 431, 501)
+}
+_JSON_HEADERS = b"Content-Type: application/json\r\nContent-Length: %d\r\n"
+_X_COINS = b"X-Coins: %d\r\n"
+_X_INVENTORY_REMAINING = b"X-Inventory-Remaining: %d\r\n"
+_CONNECTION_CLOSE = b"Connection: close\r\n"
+_CONNECTION_KEEP_ALIVE = b"Connection: keep-alive\r\n"
+
+# Every response but a 204 must state its length to keep the connection
+# usable, including the header-only errors. These are complete, ready-made
+# response triples; errors that report coins only need the count filled in.
+_NO_BODY = b"Content-Length: 0\r\n"
+_NO_BODY_X_COINS = _NO_BODY + _X_COINS
+_BAD_REQUEST = (400, _NO_BODY, b"")
+_NOT_FOUND = (404, _NO_BODY, b"")
+_TOO_LARGE = (413, _NO_BODY, b"")
+_HEAD_TOO_LARGE = (431, _NO_BODY, b"")
+_NOT_IMPLEMENTED = (501, _NO_BODY, b"")
+
+# A purchase always dispenses exactly one item, so its body is a constant.
+# Still produced by json.dumps, just once at import instead of per request.
+_DISPENSED_BODY = json.dumps({"quantity": 1}).encode()
+_DISPENSED_HEADERS = _JSON_HEADERS % len(_DISPENSED_BODY)
+
+
+def _json_response(code, payload):
+    """Wrap an already-encoded JSON payload with correct Content-Type/Length."""
+    return code, _JSON_HEADERS % len(payload), payload
+
+
+# Every GET response triple, precomputed with its Content-Length. Stock only
+# counts down from INITIAL_STOCK, so there are INITIAL_STOCK + 1 possible item
+# bodies and (INITIAL_STOCK + 1) ** ITEM_COUNT inventory snapshots — 216 for
+# the default machine. Snapshots are keyed by the raw bytes of the inventory
+# array, which hash without building a tuple.
+_QTY_RESPONSES = {
+    qty: _json_response(200, json.dumps(qty).encode())
+    for qty in range(INITIAL_STOCK + 1)
+}
+_INVENTORY_RESPONSES = {
+    array.array("i", combo).tobytes(): _json_response(200, json.dumps(combo).encode())
+    for combo in itertools.product(range(INITIAL_STOCK + 1), repeat=ITEM_COUNT)
 }
 
-ITEM_PRICE = 2  # quarters required per purchase
 
+def _format_date_header():
+    return b"Date: %s\r\n" % formatdate(time.time(), usegmt=True).encode()
 
-class VendingHandler(BaseHTTPRequestHandler):
 
-    # ------------------------------------------------------------------ #
-    # Dispatch — called by BaseHTTPRequestHandler for each HTTP method    #
-    # ------------------------------------------------------------------ #
+# The Date header line, re-formatted once per second by _date_ticker rather
+# than per response. Rebinding a global is atomic, so _render can read it
+# from the event loop without a lock.
+_date_header = _format_date_header()
+_date_thread = None
 
-    def do_GET(self):
-        segments, item_id = self._parse_path()
-        if segments is None:
-            return  # _parse_path already sent a 404
-        if segments == ["inventory"]:
-            self._handle_inventory_get()
-        elif len(segments) == 2 and segments[0] == "inventory" and item_id is not None:
-            self._handle_item_get(item_id)
-        else:
-            self._send_error_plain(404, {})
-
-    def do_PUT(self):
-        segments, item_id = self._parse_path()
-        if segments is None:
-            return
-        if segments == [""]:
-            self._handle_root_put()
-        elif len(segments) == 2 and segments[0] == "inventory" and item_id is not None:
-            self._handle_item_put(item_id)
-        else:
-            self._send_error_plain(404, {})
-
-    def do_DELETE(self):
-        segments, item_id = self._parse_path()
-        if segments is None:
-            return
-        if segments == [""]:
-            self._handle_root_delete()
-        else:
-            self._send_error_plain(404, {})
 
-    # ------------------------------------------------------------------ #
-    # Path parsing                                                         #
-    # ------------------------------------------------------------------ #
+def _date_ticker():
+    """Refresh _date_header now, then just after every second boundary."""
+    global _date_header
+    while True:
+        _date_header = _format_date_header()
+        time.sleep(1.0 - time.time() % 1.0)
 
-    def _parse_path(self):
-        """
-        Normalize the request path and extract a validated item ID if present.
 
-        Returns:
-            (segments, item_id) on success — item_id is None for non-item routes.
-            (None, None) if the path is invalid; response has already been sent.
-        """
-        # Strip query string and trailing slash; treat bare "/" specially
-        raw = self.path.split("?")[0].rstrip("/") or "/"
-        if raw == "/":
-            return [""], None
+def _coins_add(n):
+    """Add n quarters to the running total and return the new total."""
+    with _coins_lock:
+        _state.coins += n
+        return _state.coins
 
-        parts = raw.lstrip("/").split("/")
 
-        item_id = None
-        if len(parts) == 2 and parts[0] == "inventory":
-            # Validate that the ID segment is a non-negative integer in range
-            try:
-                item_id = int(parts[1])
-            except ValueError:
-                self._send_error_plain(404, {})
-                return None, None
-            with _lock:
-                if item_id < 0 or item_id >= len(_state["inventory"]):
-                    self._send_error_plain(404, {})
-                    return None, None
-
-        return parts, item_id
-
-    # ------------------------------------------------------------------ #
-    # Route handlers                                                       #
-    # ------------------------------------------------------------------ #
-
-    def _handle_root_put(self):
-        """PUT / — accept a single quarter and add it to the running total."""
-        body = self._read_json_body()
-        if body is None:
-            self._send_error_plain(400, {})
-            return
-
-        coin = body.get("coin", 0)
-        if coin not in (0, 1):  # machine only accepts one coin at a time
-            self._send_error_plain(400, {})
-            return
-
-        with _lock:
-            _state["coins"] += coin
-            total = _state["coins"]
-
-        # X-Coins reflects the total accepted so far in this session
-        self._send_no_content({"X-Coins": str(total)})
-
-    def _handle_root_delete(self):
-        """DELETE / — cancel the transaction and return all inserted coins."""
-        with _lock:
-            returned = _state["coins"]
-            _state["coins"] = 0
-        self._send_no_content({"X-Coins": str(returned)})
-
-    def _handle_inventory_get(self):
-        """GET /inventory — return a snapshot of all item quantities."""
-        with _lock:
-            snapshot = list(_state["inventory"])  # copy to release lock quickly
-        self._send_json(200, snapshot, {})
-
-    def _handle_item_get(self, item_id):
-        """GET /inventory/:id — return the quantity for a single item."""
-        with _lock:
-            qty = _state["inventory"][item_id]
-        self._send_json(200, qty, {})
-
-    def _handle_item_put(self, item_id):
-        """
-        PUT /inventory/:id — attempt to purchase the item.
+def _coins_take():
+    """Reset the running total to 0 and return what it held (atomic exchange)."""
+    with _coins_lock:
+        returned = _state.coins
+        _state.coins = 0
+        return returned
 
-        Priority of error checks (per spec):
-          1. Out of stock  → 404, coins kept
-          2. Insufficient funds → 403, coins kept
-          3. Success → 200, change returned via X-Coins
-        """
-        with _lock:
-            qty = _state["inventory"][item_id]
-            coins = _state["coins"]
-
-            # Check 1: out of stock — coins stay in machine
-            if qty == 0:
-                self._send_error_plain(404, {"X-Coins": str(coins)})
-                return
-
-            # Check 2: not enough quarters — coins stay in machine
-            if coins < ITEM_PRICE:
-                self._send_error_plain(403, {"X-Coins": str(coins)})
-                return
-
-            # Success: decrement inventory, deduct price, compute change
-            _state["inventory"][item_id] -= 1
-            _state["coins"] -= ITEM_PRICE
-            new_qty = _state["inventory"][item_id]
-            change = _state["coins"]  # leftover quarters returned to customer
-
-        # quantity in the body = items dispensed this transaction (always 1)
-        self._send_json(
-            200,
-            {"quantity": 1},
-            {"X-Coins": str(change), "X-Inventory-Remaining": str(new_qty)},
-        )
-
-    # ------------------------------------------------------------------ #
-    # Response helpers                                                     #
-    # ------------------------------------------------------------------ #
-
-    def _send_no_content(self, headers):
-        """Send a 204 with custom headers and no body."""
-        self.send_response(204)
-        for k, v in headers.items():
-            self.send_header(k, v)
-        self.end_headers()
-
-    def _send_json(self, code, body, headers):
-        """Serialize body to JSON and send with correct Content-Type/Length."""
-        payload = json.dumps(body).encode()
-        self.send_response(code)
-        self.send_header("Content-Type", "application/json")
-        self.send_header("Content-Length", str(len(payload)))
-        for k, v in headers.items():
-            self.send_header(k, v)
-        self.end_headers()
-        self.wfile.write(payload)
-
-    def _send_error_plain(self, code, headers):
-        """
-        Send an error status with optional headers and no body.
-        Avoids BaseHTTPRequestHandler.send_error() which appends an HTML body.
-        """
-        self.send_response(code)
-        for k, v in headers.items():
-            self.send_header(k, v)
-        self.end_headers()
 
-    def _read_json_body(self):
+# ---------------------------------------------------------------------------
+# Route handlers
+# Pure functions: each takes what it needs from the request and returns a
+# (status, headers, body) triple, where headers is a bytes block of complete
+# header lines, each ending in CRLF. The connection loop does all the I/O.
+# ---------------------------------------------------------------------------
+
+# The bodies PUT / receives in practice, already parsed: {"coin": 0} and
+# {"coin": 1}, both compact and with json.dumps' default spacing. Anything
+# else still goes through json.loads. Shared between requests, so read-only.
+_KNOWN_BODIES = {
+    json.dumps({"coin": coin}, separators=separators).encode(): {"coin": coin}
+    for coin in (0, 1)
+    for separators in ((",", ":"), (", ", ": "))
+}
+
+
+def _parse_json_body(raw):
+    """
+    Parse the request body.
+    Returns a dict on success, empty dict if no body, None if the body is not
+    a JSON object. The dict may be shared, so callers must not modify it.
+    """
+    known = _KNOWN_BODIES.get(raw)
+    if known is not None:
+        return known
+    if not raw:
+        return {}
+    try:
+        body = json.loads(raw)
+    except ValueError:  # JSONDecodeError, or bytes that aren't valid UTF-8
+        return None
+    except RecursionError:  # arrays or objects nested too deep to parse
+        return None
+    return body if isinstance(body, dict) else None
+
+
+def _handle_root_put(raw_body):
+    """PUT / — accept a single quarter and add it to the running total."""
+    body = _parse_json_body(raw_body)
+    if body is None:
+        return _BAD_REQUEST
+
+    coin = body.get("coin", 0)
+    if coin not in (0, 1):  # machine only accepts one coin at a time
+        return _BAD_REQUEST
+
+    total = _coins_add(coin)
+
+    # X-Coins reflects the total accepted so far in this session
+    return 204, _X_COINS % total, b""
+
+
+def _handle_root_delete(raw_body):
+    """DELETE / — cancel the transaction and return all inserted coins."""
+    returned = _coins_take()
+    return 204, _X_COINS % returned, b""
+
+
+def _handle_inventory_get(raw_body):
+    """GET /inventory — return a snapshot of all item quantities."""
+    # One C-level copy of the whole array, so the snapshot is consistent
+    # even while purchases hold their item locks
+    key = _state.inventory.tobytes()
+    response = _INVENTORY_RESPONSES.get(key)
+    if response is None:  # only if the state was set outside the table's range
+        snapshot = array.array("i", key).tolist()
+        response = _json_response(200, json.dumps(snapshot).encode())
+    return response
+
+
+def _handle_item_get(item_id):
+    """GET /inventory/:id — return the quantity for a single item."""
+    qty = _state.inventory[item_id]
+    response = _QTY_RESPONSES.get(qty)
+    if response is None:  # only if the state was set outside the table's range
+        response = _json_response(200, json.dumps(qty).encode())
+    return response
+
+
+def _handle_item_put(item_id):
+    """
+    PUT /inventory/:id — attempt to purchase the item.
+
+    Priority of error checks (per spec):
+      1. Out of stock  → 404, coins kept
+      2. Insufficient funds → 403, coins kept
+      3. Success → 200, change returned via X-Coins
+    """
+    with _item_locks[item_id], _coins_lock:
+        qty = _state.inventory[item_id]
+        coins = _state.coins
+
+        # Check 1: out of stock — coins stay in machine
+        if qty == 0:
+            return 404, _NO_BODY_X_COINS % coins, b""
+
+        # Check 2: not enough quarters — coins stay in machine
+        if coins < ITEM_PRICE:
+            return 403, _NO_BODY_X_COINS % coins, b""
+
+        # Success: decrement inventory, deduct price, compute change
+        _state.inventory[item_id] -= 1
+        _state.coins -= ITEM_PRICE
+        new_qty = _state.inventory[item_id]
+        change = _state.coins  # leftover quarters returned to customer
+
+    # quantity in the body = items dispensed this transaction (always 1)
+    return (
+        200,
+        _DISPENSED_HEADERS + _X_COINS % change + _X_INVENTORY_REMAINING % new_qty,
+        _DISPENSED_BODY,
+    )
+
+
+# ---------------------------------------------------------------------------
+# Dispatch
+# ---------------------------------------------------------------------------
+
+# Route tags produced by _route(); small ints so lookups hash cheaply
+_NO_ROUTE, _ROOT, _INVENTORY, _ITEM = range(4)
+
+_ITEM_PREFIX = b"/inventory/"
+# Any ID with more significant digits than the largest valid one is out of range
+_MAX_ID_DIGITS = len(str(ITEM_COUNT - 1))
+
+_ROUTES = {
+    (b"GET", _INVENTORY): _handle_inventory_get,
+    (b"PUT", _ROOT): _handle_root_put,
+    (b"DELETE", _ROOT): _handle_root_delete,
+}
+_ITEM_ROUTES = {
+    b"GET": _handle_item_get,
+    b"PUT": _handle_item_put,
+}
+
+_METHODS = frozenset((b"GET", b"PUT", b"DELETE"))
+
+
+def _parse_small_uint(digits):
+    """
+    Parse a short run of ASCII digits without going through an exception.
+    Leading zeros are ignored, as int() ignores them. Returns -1 if digits is
+    empty, has more than _MAX_ID_DIGITS significant digits, or holds anything
+    but 0-9 (bytes.isdigit() is ASCII-only, so no sign, whitespace,
+    underscores or non-ASCII digits get through the way they would with int()).
+    """
+    if digits.isdigit():
+        significant = digits.lstrip(b"0")
+        if len(significant) <= _MAX_ID_DIGITS:
+            return int(significant) if significant else 0
+    return -1
+
+
+def _route(target):
+    """
+    Classify a raw request target in a single pass, without building lists.
+
+    Returns (route tag, item ID); the ID is -1 unless the tag is _ITEM.
+    Query strings and a single trailing slash are ignored.
+    """
+    q = target.find(b"?")
+    path = target if q < 0 else target[:q]
+    if path == b"/" or path == b"":
+        return _ROOT, -1
+    if path == b"/inventory" or path == b"/inventory/":
+        return _INVENTORY, -1
+    if path.startswith(_ITEM_PREFIX):
+        end = len(path) - 1 if path.endswith(b"/") else len(path)
+        item_id = _parse_small_uint(path[len(_ITEM_PREFIX):end])
+        if item_id >= 0:
+            return _ITEM, item_id
+    return _NO_ROUTE, -1
+
+
+def _dispatch(method, target, raw_body):
+    """
+    Route a request via the _ROUTES / _ITEM_ROUTES tables.
+
+    Fixed paths resolve with a single dict lookup on (method, route tag);
+    item routes are keyed by method once the ID is range-checked. Anything
+    else is a 404.
+    """
+    if method not in _METHODS:
+        return _NOT_IMPLEMENTED
+
+    tag, item_id = _route(target)
+    if tag == _ITEM:
+        handler = _ITEM_ROUTES.get(method)
+        if handler is not None and item_id < len(_state.inventory):
+            return handler(item_id)
+        return _NOT_FOUND
+
+    handler = _ROUTES.get((method, tag))
+    if handler is not None:
+        return handler(raw_body)
+    return _NOT_FOUND
+
+
+# ---------------------------------------------------------------------------
+# Connection handling
+# A minimal HTTP/1.1 front end with persistent connections: requests are
+# served in order on one connection until the client asks to close it.
+# Error responses carry headers only — no HTML body like the stdlib's
+# BaseHTTPRequestHandler.send_error() would append.
+# ---------------------------------------------------------------------------
+
+def _header_value(lowered_head, marker):
+    """
+    Pull one header's value straight out of a lower-cased request head,
+    without parsing any other header. marker is the lower-case name with a
+    leading CRLF and a trailing colon, so it only matches a whole header name
+    at the start of a line. Returns None if the header is absent.
+    """
+    start = lowered_head.find(marker)
+    if start < 0:
+        return None
+    start += len(marker)
+    end = lowered_head.find(b"\r\n", start)
+    return (lowered_head[start:] if end < 0 else lowered_head[start:end]).strip()
+
+
+def _has_hidden_header(head):
+    """
+    True if a header line starts with whitespace (obsolete line folding) or
+    has whitespace between its name and the colon. Either would slip past
+    _header_value's markers and be taken for an absent header, so the head
+    is rejected instead, as RFC 9112 requires.
+    """
+    if b"\r\n " in head or b"\r\n\t" in head:
+        return True
+    if b" :" not in head and b"\t:" not in head:
+        return False  # the usual case: no line worth splitting out
+    for line in head.split(b"\r\n")[1:]:
+        if line.partition(b":")[0].endswith((b" ", b"\t")):
+            return True
+    return False
+
+
+def _render(code, headers, body):
+    """Join status line, headers and body into one buffer for a single write."""
+    return b"".join((
+        _RESPONSE_PREFIXES[code],
+        _date_header,
+        headers,
+        b"\r\n",
+        body,
+    ))
+
+
+# Longest request head accepted; a longer one gets a 431 and is closed on,
+# whether or not its blank line has arrived yet
+_MAX_HEAD = 64 * 1024
+# Largest request body accepted; PUT / only ever needs about a dozen bytes
+_MAX_BODY = 1024
+_MAX_BODY_DIGITS = len(str(_MAX_BODY))
+
+# Header-line markers for _header_value, matched against the lower-cased head
+_CONTENT_LENGTH = b"\r\ncontent-length:"
+_CONNECTION = b"\r\nconnection:"
+_TRANSFER_ENCODING = b"\r\ntransfer-encoding:"
+
+_TCP_QUICKACK = getattr(socket, "TCP_QUICKACK", None)  # Linux only
+
+
+def _parse_head(head):
+    """
+    Parse a request head: the request line and headers, minus the blank line.
+
+    Returns (raw request line, method, target, body length, connection header).
+    If the head is rejected, method is None and target holds the error
+    response to send before closing. The connection header is b"" for a
+    persistent HTTP/1.1 connection, otherwise the line to echo back; anything
+    but _CONNECTION_CLOSE keeps the connection open.
+    """
+    eol = head.find(b"\r\n")
+    line = head if eol < 0 else head[:eol]
+    if len(head) > _MAX_HEAD:
+        return line, None, _HEAD_TOO_LARGE, 0, _CONNECTION_CLOSE
+    # "METHOD target HTTP/x.y" — locate the two spaces instead of splitting
+    sp1 = line.find(b" ")
+    sp2 = line.rfind(b" ")
+    if sp1 <= 0 or sp2 == sp1 or not line.startswith(b"HTTP/", sp2 + 1):
+        return line, None, _BAD_REQUEST, 0, _CONNECTION_CLOSE
+    if _has_hidden_header(head):
+        return line, None, _BAD_REQUEST, 0, _CONNECTION_CLOSE
+
+    # Only two headers matter, so look them up directly in one lower-cased
+    # copy of the head instead of splitting every header line into a dict
+    lowered = head.lower()
+
+    # On a persistent connection the body length decides where the next
+    # request starts, so anything that could frame the body differently
+    # from Content-Length is refused rather than guessed at. The markers
+    # match every spelling left once _has_hidden_header has passed the head.
+    if _TRANSFER_ENCODING in lowered:
+        return line, None, _NOT_IMPLEMENTED, 0, _CONNECTION_CLOSE
+    length = _header_value(lowered, _CONTENT_LENGTH)
+    if lowered.count(_CONTENT_LENGTH) > 1 and any(
+        part.split(b"\r\n", 1)[0].strip() != length
+        for part in lowered.split(_CONTENT_LENGTH)[2:]
+    ):
+        return line, None, _BAD_REQUEST, 0, _CONNECTION_CLOSE
+    if length is None:
+        length = 0
+    elif not length.isdigit():  # also rejects a present but empty value
+        return line, None, _BAD_REQUEST, 0, _CONNECTION_CLOSE
+    # Checking the digit count first keeps int() off absurdly long values
+    elif len(length) > _MAX_BODY_DIGITS or int(length) > _MAX_BODY:
+        return line, None, _TOO_LARGE, 0, _CONNECTION_CLOSE
+    else:
+        length = int(length)
+
+    # HTTP/1.1 persists unless told otherwise; HTTP/1.0 only on request
+    connection = _header_value(lowered, _CONNECTION)
+    if line.endswith(b"HTTP/1.0"):
+        if connection == b"keep-alive":
+            reply_connection = _CONNECTION_KEEP_ALIVE
+        else:
+            reply_connection = _CONNECTION_CLOSE
+    elif connection == b"close":
+        reply_connection = _CONNECTION_CLOSE
+    else:
+        reply_connection = b""
+
+    return line, line[:sp1], line[sp1 + 1:sp2], length, reply_connection
+
+
+class _VendingProtocol(asyncio.Protocol):
+    """
+    One instance per connection.
+
+    Requests are parsed straight out of the received bytes inside
+    data_received(), so serving one costs plain function calls — no
+    coroutine, future or StreamReader hand-off — and each response goes to
+    the transport in a single write. Pipelined requests are answered in order.
+    """
+
+    def connection_made(self, transport):
+        self._transport = transport
+        # asyncio already sets TCP_NODELAY on every accepted TCP socket, so
+        # small responses are never held back by Nagle. On Linux, also ACK
+        # the client's segments immediately instead of waiting on the
+        # delayed-ACK timer; the kernel may fall back to delayed ACKs later,
+        # this just keeps the opening exchanges of a connection prompt.
+        sock = transport.get_extra_info("socket")
+        if _TCP_QUICKACK is not None and sock is not None:
+            try:
+                sock.setsockopt(socket.IPPROTO_TCP, _TCP_QUICKACK, 1)
+            except OSError:
+                pass  # not a TCP socket, or the platform refuses; harmless
+        self._buffer = bytearray()  # unconsumed tail of earlier reads, if any
+        self._head = None  # parsed head still waiting for its body
+
+    def data_received(self, data):
+        # Usually a read holds whole requests and the buffer is empty, so data
+        # is parsed in place; the buffer only ever carries a partial request
+        # over to the next read. Reads of a partial request are appended to
+        # it, and it is only copied out for parsing once the head or body it
+        # is waiting on is complete, so a request trickling in over many
+        # reads costs linear time, not a copy of the whole buffer per read.
+        buf = self._buffer
+        if buf:
+            scanned = len(buf)
+            buf += data
+            if self._head is None:
+                # Only the new bytes, plus 3 for a CRLFCRLF split across reads
+                start = max(scanned - 3, 0)
+                if (buf.find(b"\r\n\r\n", start) < 0 and buf.find(b"\n\n", start) < 0
+                        and len(buf) <= _MAX_HEAD):
+                    return  # head still incomplete, and not yet too long
+            elif len(buf) < self._head[3]:
+                return  # body still incomplete
+            data = bytes(buf)
+            buf.clear()
+        used = self._consume(data)
+        if used < len(data):
+            buf += memoryview(data)[used:]
+
+    def _consume(self, data):
         """
-        Read and parse the request body using Content-Length.
-        Returns a dict on success, empty dict if no body, None on parse error.
+        Serve every complete request in data, walking it with an offset rather
+        than trimming a buffer per request. Returns how many bytes were used.
         """
-        length = int(self.headers.get("Content-Length", 0))
-        if length == 0:
-            return {}
-        raw = self.rfile.read(length)
-        try:
-            return json.loads(raw)
-        except json.JSONDecodeError:
-            return None
+        pos = 0
+        while True:
+            if self._head is None:
+                end = data.find(b"\r\n\r\n", pos)
+                # A head ended by a bare LF LF will never see its CRLFCRLF, so
+                # answer it now instead of leaving the client waiting forever
+                if data.find(b"\n\n", pos, len(data) if end < 0 else end) >= 0:
+                    eol = data.find(b"\n", pos)
+                    requestline = data[pos:eol].rstrip(b"\r")
+                    self._respond(requestline, _CONNECTION_CLOSE, _BAD_REQUEST)
+                    return len(data)
+                if end < 0:
+                    if len(data) - pos <= _MAX_HEAD:
+                        return pos
+                    end = len(data)  # too long already; reject what's here
+                self._head = _parse_head(data[pos:end])
+                pos = end + 4
+
+            requestline, method, target, length, connection = self._head
+            if method is None:
+                self._respond(requestline, connection, target)
+                return len(data)
+            if len(data) - pos < length:
+                return pos  # rest of the body hasn't arrived yet
+
+            raw_body = data[pos:pos + length]
+            pos += length
+            self._head = None
+            self._respond(requestline, connection, _dispatch(method, target, raw_body))
+            if connection is _CONNECTION_CLOSE:
+                return len(data)
+
+    def _respond(self, requestline, connection, response):
+        code, headers, body = response
+        self._transport.write(_render(code, headers + connection, body))
+        if _LOG_ENABLED:
+            _log_request(self._transport, requestline, code)
+        if connection is _CONNECTION_CLOSE:
+            self._transport.close()  # flushes the response first
+
+    # A client pipelining faster than it reads replies must not make the
+    # write buffer grow without bound: stop reading until it drains.
+    def pause_writing(self):
+        self._transport.pause_reading()
+
+    def resume_writing(self):
+        self._transport.resume_reading()
 
-    # ------------------------------------------------------------------ #
-    # Logging                                                              #
-    # ------------------------------------------------------------------ #
 
-    def log_message(self, fmt, *args):
-        # Route access logs to stdout instead of stderr (default behavior)
-        print(f"{self.address_string()} - {fmt % args}")
+# ---------------------------------------------------------------------------
+# Access logging
+# Off by default: formatting and printing a line costs more than serving the
+# request it describes. VEND_LOG=1 turns it on; lines then go through a queue
+# to a background thread, so the event loop never blocks on stdout.
+# ---------------------------------------------------------------------------
+_LOG_ENABLED = os.environ.get("VEND_LOG") == "1"
+_log_queue = queue.SimpleQueue()
+_log_thread = None
+
+
+def _log_request(transport, requestline, code):
+    # Same shape http.server uses, minus the timestamp
+    peer = transport.get_extra_info("peername")
+    host = peer[0] if peer else "-"
+    _log_queue.put(f'{host} - "{requestline.decode("latin-1")}" {code} -\n')
+
+
+def _log_writer():
+    """Drain the log queue to stdout, batching whatever has piled up."""
+    while True:
+        lines = [_log_queue.get()]
+        while not _log_queue.empty():
+            lines.append(_log_queue.get())
+        data = "".join(lines).encode()
+        while data:
+            data = data[os.write(1, data):]
 
 
 # ---------------------------------------------------------------------------
 # Server
 # ---------------------------------------------------------------------------
 
-class _ReuseAddrServer(ThreadingHTTPServer):
-    # SO_REUSEADDR must be set before bind(), so it lives as a class attribute.
-    # This allows the server to restart immediately without "Address already in use".
-    allow_reuse_address = True
+async def start_server(host="", port=8080):
+    """
+    Bind and start accepting connections on the running event loop, starting
+    the Date ticker (and log writer, if enabled) on first use.
+    Returns the asyncio.Server; SO_REUSEADDR is set by asyncio on POSIX, so
+    restarts never hit "Address already in use".
+    """
+    global _date_thread, _log_thread
+    if _date_thread is None:
+        _date_thread = threading.Thread(target=_date_ticker, daemon=True)
+        _date_thread.start()
+    if _LOG_ENABLED and _log_thread is None:
+        _log_thread = threading.Thread(target=_log_writer, daemon=True)
+        _log_thread.start()
+    loop = asyncio.get_running_loop()
+    return await loop.create_server(_VendingProtocol, host or None, port, backlog=128)
+
+
+async def _serve(port):
+    server = await start_server("", port)
+    print(f"Vend-O-Matic listening on port {port}")
+    async with server:
+        await server.serve_forever()
 
 
 if __name__ == "__main__":
-    port = int(os.environ.get("PORT", 8080))
-    server = _ReuseAddrServer(("", port), VendingHandler)
-    print(f"Vend-O-Matic listening on port {port}")
     try:
-        server.serve_forever()
+        asyncio.run(_serve(int(os.environ.get("PORT", 8080))))
     except KeyboardInterrupt:
         print("\nShutting down.")
@@ -1,14 +1,19 @@
 """
 Tests for Vend-O-Matic API.
-Starts the server in a background thread, runs all cases, then shuts down.
+Starts the server's event loop in a background thread, runs all cases, then
+shuts down.
 """
 
+import array
+import asyncio
+import contextlib
+import http.client
 import json
+import socket
 import threading
 import unittest
 import urllib.request
 import urllib.error
-from http.server import ThreadingHTTPServer
 
 # Import the handler and reset state between tests
 import app as vending
@@ -32,24 +37,45 @@ def _request(method, path, body=None):
         return e.code, dict(e.headers), raw
 
 
+def _raw_exchange(*packets):
+    """Send raw request bytes, one sendall per packet; read until the server closes."""
+    with socket.create_connection(("localhost", 18080), timeout=5) as sock:
+        for packet in packets:
+            sock.sendall(packet)
+        raw = b""
+        while True:
+            chunk = sock.recv(4096)
+            if not chunk:
+                return raw
+            raw += chunk
+
+
 def _reset_state():
-    with vending._lock:
-        vending._state["coins"] = 0
-        vending._state["inventory"] = [5, 5, 5]
+    # Same order the server uses: item locks by ID, then the coin lock
+    with contextlib.ExitStack() as stack:
+        for lock in (*vending._item_locks, vending._coins_lock):
+            stack.enter_context(lock)
+        vending._state.coins = 0
+        vending._state.inventory = array.array("i", [5, 5, 5])
 
 
 class TestVendOMatic(unittest.TestCase):
 
     @classmethod
     def setUpClass(cls):
-        cls.server = ThreadingHTTPServer(("", 18080), vending.VendingHandler)
-        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.loop = asyncio.new_event_loop()
+        cls.server = cls.loop.run_until_complete(vending.start_server("", 18080))
+        cls.thread = threading.Thread(target=cls.loop.run_forever)
         cls.thread.daemon = True
         cls.thread.start()
 
     @classmethod
     def tearDownClass(cls):
-        cls.server.shutdown()
+        cls.loop.call_soon_threadsafe(cls.loop.stop)
+        cls.thread.join()
+        cls.server.close()
+        cls.loop.run_until_complete(cls.server.wait_closed())
+        cls.loop.close()
 
     def setUp(self):
         _reset_state()
@@ -69,6 +95,19 @@ class TestVendOMatic(unittest.TestCase):
         self.assertEqual(status, 204)
         self.assertEqual(headers.get("X-Coins"), "2")
 
+    def test_insert_coin_unusual_spacing(self):
+        # Spellings outside the pre-parsed set still go through the JSON parser
+        req = urllib.request.Request(BASE + "/", data=b'{ "coin" :1 }', method="PUT")
+        with urllib.request.urlopen(req) as resp:
+            self.assertEqual(resp.status, 204)
+            self.assertEqual(resp.headers.get("X-Coins"), "1")
+
+    def test_insert_deeply_nested_body(self):
+        # Nested deeper than the JSON parser can recurse; must be a 400, not an
+        # exception escaping into the event loop
+        status, _, _ = vending._handle_root_put(b"[" * 100000)
+        self.assertEqual(status, 400)
+
     def test_insert_zero_coin_noop(self):
         status, headers, _ = _request("PUT", "/", {"coin": 0})
         self.assertEqual(status, 204)
@@ -112,6 +151,21 @@ class TestVendOMatic(unittest.TestCase):
         _, _, body = _request("GET", "/inventory")
         self.assertEqual(json.loads(body), [5, 4, 5])
 
+    def test_get_inventory_refreshes_after_purchase(self):
+        # Each stock level has its own precomputed response: after a purchase
+        # the lookup must land on the new snapshot's entry, length included
+        _request("PUT", "/", {"coin": 1})
+        _request("PUT", "/", {"coin": 1})
+        _request("PUT", "/inventory/0")
+        _, headers, body = _request("GET", "/inventory")
+        self.assertEqual(json.loads(body), [4, 5, 5])
+        self.assertEqual(headers.get("Content-Length"), str(len(body)))
+        with vending._item_locks[2]:
+            vending._state.inventory[2] = 0
+        _, headers, body = _request("GET", "/inventory")
+        self.assertEqual(json.loads(body), [4, 5, 0])
+        self.assertEqual(headers.get("Content-Length"), str(len(body)))
+
     # ------------------------------------------------------------------ #
     # GET /inventory/:id                                                   #
     # ------------------------------------------------------------------ #
@@ -125,6 +179,29 @@ class TestVendOMatic(unittest.TestCase):
         status, _, _ = _request("GET", "/inventory/99")
         self.assertEqual(status, 404)
 
+    def test_get_item_non_numeric_id(self):
+        status, _, _ = _request("GET", "/inventory/abc")
+        self.assertEqual(status, 404)
+
+    def test_get_item_leading_zeros(self):
+        status, _, body = _request("GET", "/inventory/01")
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), 5)
+        status, _, _ = _request("GET", "/inventory/00")
+        self.assertEqual(status, 200)
+
+    def test_get_item_signed_id(self):
+        status, _, _ = _request("GET", "/inventory/+1")
+        self.assertEqual(status, 404)
+
+    def test_get_item_non_ascii_digit_id(self):
+        # ARABIC-INDIC DIGIT ONE, which int() would take for 1
+        raw = _raw_exchange(
+            b"GET /inventory/" + "\u0661".encode() + b" HTTP/1.1\r\n"
+            b"Connection: close\r\n\r\n"
+        )
+        self.assertTrue(raw.startswith(b"HTTP/1.1 404 "))
+
     # ------------------------------------------------------------------ #
     # PUT /inventory/:id  — purchase                                       #
     # ------------------------------------------------------------------ #
@@ -197,6 +274,151 @@ class TestVendOMatic(unittest.TestCase):
         self.assertEqual(status, 200)
         self.assertEqual(json.loads(body), 4)
 
+    # ------------------------------------------------------------------ #
+    # Persistent connections                                               #
+    # ------------------------------------------------------------------ #
+
+    def test_keep_alive_reuses_connection(self):
+        conn = http.client.HTTPConnection("localhost", 18080)
+        try:
+            conn.request("PUT", "/", body=json.dumps({"coin": 1}))
+            resp = conn.getresponse()
+            resp.read()
+            sock = conn.sock
+            # A header-only error must not end the connection either
+            conn.request("GET", "/unknown")
+            resp = conn.getresponse()
+            resp.read()
+            self.assertEqual(resp.status, 404)
+            conn.request("PUT", "/", body=json.dumps({"coin": 1}))
+            resp = conn.getresponse()
+            resp.read()
+            self.assertIs(conn.sock, sock)
+            self.assertEqual(resp.getheader("X-Coins"), "2")
+        finally:
+            conn.close()
+
+    def test_pipelined_requests_answered_in_order(self):
+        # Two requests in one packet, the second body split across packets
+        raw = _raw_exchange(
+            b'PUT / HTTP/1.1\r\nContent-Length: 10\r\n\r\n{"coin":1}'
+            b'PUT / HTTP/1.1\r\nContent-Length: 10\r\n\r\n{"co',
+            b'in":1}GET /inventory HTTP/1.1\r\nConnection: close\r\n\r\n',
+        )
+        self.assertEqual(raw.count(b"HTTP/1.1 204 No Content"), 2)
+        self.assertLess(raw.index(b"X-Coins: 1"), raw.index(b"X-Coins: 2"))
+        self.assertTrue(raw.endswith(b"\r\n\r\n[5, 5, 5]"))
+
+    def test_transfer_encoding_rejected(self):
+        # Chunk data must not be taken for the next request on the connection,
+        # here a complete coin insert, however the header name is spelled
+        chunk = b'PUT / HTTP/1.1\r\nContent-Length: 10\r\n\r\n{"coin":1}'
+        for name, code in ((b"Transfer-Encoding:", b"501"),
+                           (b"Transfer-Encoding :", b"400")):
+            with self.subTest(name=name):
+                raw = _raw_exchange(
+                    b"PUT / HTTP/1.1\r\n" + name + b" chunked\r\n\r\n"
+                    + b"%x\r\n" % len(chunk) + chunk + b"\r\n0\r\n\r\n"
+                )
+                self.assertTrue(raw.startswith(b"HTTP/1.1 " + code + b" "))
+                self.assertEqual(raw.count(b"HTTP/1.1 "), 1)
+                self.assertIn(b"\r\nConnection: close\r\n", raw)
+        self.assertEqual(vending._state.coins, 0)
+
+    def test_conflicting_content_lengths_rejected(self):
+        for second in (b"Content-Length: 1", b"Content-Length : 1"):
+            with self.subTest(second=second):
+                raw = _raw_exchange(
+                    b"PUT / HTTP/1.1\r\nContent-Length: 10\r\n" + second
+                    + b'\r\n\r\n{"coin":1}'
+                )
+                self.assertTrue(raw.startswith(b"HTTP/1.1 400 "))
+                self.assertEqual(raw.count(b"HTTP/1.1 "), 1)
+                self.assertIn(b"\r\nConnection: close\r\n", raw)
+        self.assertEqual(vending._state.coins, 0)
+
+    def test_malformed_content_length_rejected(self):
+        for value in (b"ten", b"-1", b""):
+            with self.subTest(value=value):
+                raw = _raw_exchange(
+                    b"PUT / HTTP/1.1\r\nContent-Length: " + value + b"\r\n\r\n"
+                    b'{"coin":1}'
+                )
+                self.assertTrue(raw.startswith(b"HTTP/1.1 400 "))
+                self.assertEqual(raw.count(b"HTTP/1.1 "), 1)
+                self.assertIn(b"\r\nConnection: close\r\n", raw)
+        self.assertEqual(vending._state.coins, 0)
+
+    def test_bare_lf_line_endings_rejected(self):
+        # Answered and closed, whether the blank line arrives with the head
+        # or in a later packet, rather than left waiting for a CRLF
+        for packets in (
+            (b"GET /inventory HTTP/1.0\n\n",),
+            (b"GET /inventory HTTP/1.1\nHost: localhost\n", b"\n"),
+        ):
+            with self.subTest(packets=packets):
+                raw = _raw_exchange(*packets)
+                self.assertTrue(raw.startswith(b"HTTP/1.1 400 "))
+                self.assertIn(b"\r\nConnection: close\r\n", raw)
+
+    def test_header_names_case_insensitive(self):
+        raw = _raw_exchange(
+            b"PUT / HTTP/1.1\r\nCONTENT-LENGTH: 10\r\nConnection: Close\r\n\r\n"
+            b'{"coin":1}'
+        )
+        self.assertTrue(raw.startswith(b"HTTP/1.1 204 "))
+        self.assertIn(b"\r\nX-Coins: 1\r\n", raw)
+        self.assertIn(b"\r\nConnection: close\r\n", raw)
+
+    def test_header_name_whitespace_rejected(self):
+        # Neither header may be mistaken for an absent one, which would leave
+        # the body to be read as the next request
+        for head in (
+            b"PUT / HTTP/1.1\r\nContent-Length : 10\r\n\r\n",
+            b"PUT / HTTP/1.1\r\nX-Pad: 1\r\n Content-Length: 10\r\n\r\n",
+        ):
+            with self.subTest(head=head):
+                raw = _raw_exchange(head + b'{"coin":1}GET /inventory HTTP/1.1\r\n\r\n')
+                self.assertTrue(raw.startswith(b"HTTP/1.1 400 "))
+                self.assertEqual(raw.count(b"HTTP/1.1 "), 1)
+                self.assertIn(b"\r\nConnection: close\r\n", raw)
+        self.assertEqual(vending._state.coins, 0)
+
+    def test_oversized_body_rejected(self):
+        # Refused on the head alone, before any of the body is read
+        raw = _raw_exchange(b"PUT / HTTP/1.1\r\nContent-Length: 1048576\r\n\r\n")
+        self.assertTrue(raw.startswith(b"HTTP/1.1 413 "))
+        self.assertIn(b"\r\nConnection: close\r\n", raw)
+
+    def test_oversized_head_rejected(self):
+        # Complete or not, a head past the cap is answered and closed on
+        pad = b"X-Pad: " + b"a" * 70000 + b"\r\n"
+        for tail in (b"\r\n", b""):
+            with self.subTest(complete=bool(tail)):
+                raw = _raw_exchange(b"GET /inventory HTTP/1.1\r\n" + pad + tail)
+                self.assertTrue(raw.startswith(b"HTTP/1.1 431 "))
+                self.assertEqual(raw.count(b"HTTP/1.1 "), 1)
+                self.assertIn(b"\r\nConnection: close\r\n", raw)
+
+    def test_repeated_equal_content_lengths_accepted(self):
+        raw = _raw_exchange(
+            b"PUT / HTTP/1.1\r\nContent-Length: 10\r\ncontent-length: 10\r\n"
+            b'Connection: close\r\n\r\n{"coin":1}'
+        )
+        self.assertTrue(raw.startswith(b"HTTP/1.1 204 "))
+        self.assertIn(b"\r\nX-Coins: 1\r\n", raw)
+
+    def test_connection_close_honored(self):
+        conn = http.client.HTTPConnection("localhost", 18080)
+        try:
+            conn.request("GET", "/inventory", headers={"Connection": "close"})
+            resp = conn.getresponse()
+            resp.read()
+            self.assertEqual(resp.getheader("Connection"), "close")
+            self.assertIsNone(conn.sock)
+        finally:
+            conn.close()
+
     # ------------------------------------------------------------------ #
     # Unknown routes                                                       #
     # ------------------------------------------------------------------ #
@@ -209,6 +431,11 @@ class TestVendOMatic(unittest.TestCase):
         status, _, _ = _request("PUT", "/unknown")
         self.assertEqual(status, 404)
 
+    def test_unknown_delete_route(self):
+        # Items can be read and bought, never deleted
+        status, _, _ = _request("DELETE", "/inventory/0")
+        self.assertEqual(status, 404)
+
 
 if __name__ == "__main__":
     unittest.main(verbosity=2)